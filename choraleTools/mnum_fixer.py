@@ -1,138 +1,215 @@
+import concurrent.futures
+import zipfile
+from functools import lru_cache
 from pathlib import Path
 
 from music21 import *
+from music21.musicxml import m21ToXml
 
 p = Path('/Users/Cuthbert/Desktop/Norman_Schmidt_Chorales')
 pOut = p.parent / 'Out_Chorales'
 
-def run():    
-    files = list(p.iterdir())
-    filenames = [fp.name for fp in files]
-    pos = 0
-    for c in corpus.chorales.Iterator():
-        cName = c.filePath.name
-        if '.krn' in cName:
+@lru_cache(maxsize=1)
+def choraleCorpusPaths():
+    '''
+    Maps the .mxl filename used in the input directory to the corpus path of
+    each Bach score.  Cached, so that repeated runs do not rescan the corpus.
+    '''
+    return {fp.name.replace('.xml', '.mxl'): fp
+            for fp in corpus.getComposer('bach', fileExtensions=('.mxl', '.xml'))}
+
+def run(maxWorkers=None):
+    # start from the chorales on disk, so that corpus chorales which are not
+    # there are never parsed.
+    corpusPaths = choraleCorpusPaths()
+    cNames = []
+    for fp in sorted(p.iterdir()):
+        if fp.suffix != '.mxl':
             continue
-        if '.xml' in cName:
-            cName = cName.replace('.xml', '.mxl')
-        if cName not in filenames:
-            print('skipping', cName)
+        if fp.name not in corpusPaths:
+            print('skipping', fp.name)
             continue
-        pos += 1
-        runOne(c, cName)
+        cNames.append(fp.name)
+    # maxWorkers=1 fixes the chorales here; otherwise each worker process
+    # parses its own chorale from the path that it is sent.
+    if maxWorkers == 1:
+        for cName in cNames:
+            runOneFromCorpus(cName, corpusPaths[cName])
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        list(executor.map(runOneFromCorpus,
+                          cNames,
+                          [corpusPaths[cName] for cName in cNames],
+                          chunksize=4))
+
+def runOneFromCorpus(cName, corpusPath):
+    c = converter.parse(corpusPath)
+    runOne(c, cName)
         
+class PartNumberingState:
+    '''
+    The running state of renumbering the measures of one part in runOne.
+    '''
+    def __init__(self, cName, partId):
+        self.cName = cName
+        self.partId = partId
+        self.priorMeasure = None
+        self.priorMeasureWasIncomplete = False
+        self.priorMeasureDuration = 0.0
+        self.measureNumberShift = 0
+
+    def advance(self, m, mQl, wasIncomplete=None):
+        if wasIncomplete is not None:
+            self.priorMeasureWasIncomplete = wasIncomplete
+        self.priorMeasure = m
+        self.priorMeasureDuration = mQl
+
+
+def addSuffix(ms, suffix):
+    if ms is None:
+        return suffix
+    return ms + suffix
+
+# Each handler takes (state, m, mn, ms, mQl, short, ts) and returns the new
+# (number, suffix) for the measure, or None to leave the measure untouched.
+
+def handleHalfMeasure(state, m, mn, ms, mQl, short, ts):
+    if not state.priorMeasureWasIncomplete:
+        state.advance(m, mQl, wasIncomplete=True)
+    elif state.priorMeasureDuration == short:
+        m.paddingLeft = short
+        state.advance(m, mQl, wasIncomplete=False)
+        state.measureNumberShift += 1
+        ms = addSuffix(ms, 'a')
+    else:
+        return None
+    return (mn - state.measureNumberShift, ms)
+
+def handlePerfectMeasure(state, m, mn, ms, mQl, short, ts):
+    state.advance(m, mQl, wasIncomplete=False)
+    return (mn - state.measureNumberShift, ms)
+
+def handlePickupMeasure(state, m, mn, ms, mQl, short, ts):
+    if state.priorMeasure is None:
+        # pickup measure 1
+        state.measureNumberShift += 1
+        return (0, ms)
+    elif not state.priorMeasureWasIncomplete:
+        print("Pickup following complete prior measure", state.cName, state.partId, mn)
+    elif state.priorMeasureDuration == short:
+        # good, matched up!
+        state.measureNumberShift += 1
+        ms = addSuffix(ms, 'a')
+    elif ts is not state.priorMeasure.timeSignature:
+        print("Changing TS Pickup", state.cName, state.partId, mn)
+        state.measureNumberShift += 1
+    else:
+        return None
+    m.paddingLeft = short
+    state.advance(m, mQl, wasIncomplete=True)
+    return (mn - state.measureNumberShift, ms)
+
+def handleTruncatedMeasure(state, m, mn, ms, mQl, short, ts):
+    if state.priorMeasureWasIncomplete and state.priorMeasureDuration == short:
+        print("Truncated measure following pickup...", state.cName, state.partId, mn)
+        priorMeasure = state.priorMeasure
+        priorMeasure.paddingRight = priorMeasure.paddingLeft
+        priorMeasure.paddingLeft = 0
+        state.measureNumberShift += 1
+        state.advance(m, mQl)
+        ms = addSuffix(ms, 'x')
+    else:
+        m.paddingRight = short
+        state.advance(m, mQl, wasIncomplete=True)
+    return (mn - state.measureNumberShift, ms)
+
+measureHandlers = {
+    'half': handleHalfMeasure,
+    'perfect': handlePerfectMeasure,
+    'pickup': handlePickupMeasure,
+    'truncated': handleTruncatedMeasure,
+}
+
+mxlContainer = '''<?xml version="1.0" encoding="UTF-8"?>
+<container>
+  <rootfiles>
+    <rootfile full-path="{}"/>
+  </rootfiles>
+</container>
+'''
+
+def writeMxl(s, fp):
+    '''
+    Writes s as a compressed MusicXML file to fp, exporting straight into the
+    archive rather than writing an .xml file and compressing it afterwards.
+    '''
+    xmlName = fp.with_suffix('.xml').name
+    xmlBytes = m21ToXml.GeneralObjectExporter(s).parse()
+    with zipfile.ZipFile(fp, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(xmlName, xmlBytes)
+        zf.writestr('META-INF/container.xml', mxlContainer.format(xmlName))
+
+def firstKeySignature(s):
+    '''
+    Returns the first KeySignature found in s, or None; the
+    recursive search stops at the first match.
+    '''
+    return s.recurse().getElementsByClass('KeySignature').first()
+
 def runOne(c, cName):
     pName = p / cName
     newScore = converter.parse(pName)
     newScore.metadata.composer = 'J.S. Bach'
     allSuffixesByPart = set()
     for part in newScore.parts:
-        priorMeasure = None
-        priorMeasureWasIncomplete = False
-        priorMeasureDuration = 0.0
-        measureNumberShift = 0
+        state = PartNumberingState(cName, part.id)
         partNumSuffix = []
 
-        for m in part.getElementsByClass('Measure'):
-            mn = m.number
-            ms = m.numberSuffix
-            mns = m.measureNumberWithSuffix()
-            ts = m.timeSignature or m.getContextByClass('TimeSignature')
+        # find the active time signature for each measure in one pass, rather
+        # than searching the context for every measure.
+        measures = list(part.getElementsByClass('Measure'))
+        tsByMeasure = []
+        currentTs = None
+        for m in measures:
+            if m.timeSignature is not None:
+                currentTs = m.timeSignature
+            elif currentTs is None:
+                currentTs = m.getContextByClass('TimeSignature')
+            tsByMeasure.append(currentTs)
+        # (bar length, half bar length) for each TimeSignature object, since
+        # barDuration builds a new Duration on every access.
+        barQlByTs = {}
+
+        for mIndex, m in enumerate(measures):
+            ts = tsByMeasure[mIndex]
             if ts is None:
-                print("No time signature context!", cName, part.id, mns)
+                print("No time signature context!", cName, part.id, m.measureNumberWithSuffix())
                 continue
-            barQl = ts.barDuration.quarterLength
+            mn = m.number
+            ms = m.numberSuffix
+            barLengths = barQlByTs.get(id(ts))
+            if barLengths is None:
+                barQl = ts.barDuration.quarterLength
+                barLengths = (barQl, barQl / 2)
+                barQlByTs[id(ts)] = barLengths
+            barQl, halfBarQl = barLengths
             mQl = m.duration.quarterLength
             short = barQl - mQl
-            perfect = True if short == 0 else False
-            pickup = True if not perfect and short > (barQl / 2) else False
-            truncated = True if not perfect and short < (barQl / 2) else False
-            half = True if not perfect and short == (barQl / 2) else False
-
-            if half and priorMeasureWasIncomplete==False:
-                priorMeasureWasIncomplete = True
-                priorMeasureDuration = mQl
-                priorMeasure = m
-                m.number = mn - measureNumberShift
-                partNumSuffix.append((mn - measureNumberShift, ms))
-            elif half and priorMeasureWasIncomplete and priorMeasureDuration == short:
-                priorMeasureWasIncomplete = False
-                m.paddingLeft = short
-                priorMeasure = m
-                priorMeasureDuration = mQl
-                measureNumberShift += 1
-                if ms is None:
-                    ms = 'a'
-                else:
-                    ms = ms + 'a'
-                m.number = mn - measureNumberShift
-                m.numberSuffix = ms
-                partNumSuffix.append((mn - measureNumberShift, ms))
-                
-            elif perfect:
-                priorMeasureWasIncomplete = False
-                priorMeasureDuration = mQl
-                priorMeasure = m
-                m.number = mn - measureNumberShift
-                partNumSuffix.append((mn - measureNumberShift, ms))
-            elif pickup and priorMeasure is None:
-                # pickup measure 1
-                partNumSuffix.append((0, ms))
-                m.number = 0
-                measureNumberShift += 1
-            elif truncated and priorMeasureWasIncomplete and priorMeasureDuration == short:
-                print("Truncated measure following pickup...", cName, part.id, mn)
-                priorMeasure.paddingRight = priorMeasure.paddingLeft
-                priorMeasure.paddingLeft = 0
-                measureNumberShift += 1
-                priorMeasure = m
-                priorMeasureDuration = mQl
-                if ms is None:
-                    ms = 'x'
-                else:
-                    ms = ms + 'x'
-                m.number = mn - measureNumberShift
-                m.numberSuffix = ms
-                partNumSuffix.append((mn - measureNumberShift, ms))                
-            elif truncated:
-                priorMeasureWasIncomplete = True
-                m.paddingRight = short
-                priorMeasure = m
-                priorMeasureDuration = mQl
-                m.number = mn - measureNumberShift
-                partNumSuffix.append((mn - measureNumberShift, ms))
-            elif pickup and not priorMeasureWasIncomplete:
-                print("Pickup following complete prior measure", cName, part.id, mn)
-                priorMeasureWasIncomplete = True
-                m.paddingLeft = short
-                priorMeasure = m
-                priorMeasureDuration = mQl
-                m.number = mn - measureNumberShift
-                partNumSuffix.append((mn - measureNumberShift, ms))
-            elif pickup and priorMeasureWasIncomplete and priorMeasureDuration == short:
-                # good, matched up!
-                priorMeasureWasIncomplete = True
-                m.paddingLeft = short
-                priorMeasure = m
-                priorMeasureDuration = mQl
-                measureNumberShift += 1
-                if ms is None:
-                    ms = 'a'
-                else:
-                    ms = ms + 'a'
-                m.number = mn - measureNumberShift
-                m.numberSuffix = ms
-                partNumSuffix.append((mn - measureNumberShift, ms))
-            elif pickup and priorMeasureWasIncomplete and ts is not priorMeasure.timeSignature:
-                print("Changing TS Pickup", cName, part.id, mn)
-                priorMeasureWasIncomplete = True
-                m.paddingLeft = short
-                priorMeasure = m
-                priorMeasureDuration = mQl
-                measureNumberShift += 1
-                m.number = mn - measureNumberShift
-                partNumSuffix.append((mn - measureNumberShift, ms))
-        
+            if short == 0:
+                measureKind = 'perfect'
+            elif short > halfBarQl:
+                measureKind = 'pickup'
+            elif short < halfBarQl:
+                measureKind = 'truncated'
+            else:
+                measureKind = 'half'
+
+            newNumbering = measureHandlers[measureKind](state, m, mn, ms, mQl, short, ts)
+            if newNumbering is None:
+                continue
+            m.number, m.numberSuffix = newNumbering
+            partNumSuffix.append(newNumbering)
+
         partSuffixesTuple = tuple(partNumSuffix)
         allSuffixesByPart.add(partSuffixesTuple)
         
@@ -141,9 +218,11 @@ def runOne(c, cName):
         print("Multiple conflicting measures!", cName)
         print(cName, allSuffixesByPart)
 
-    try:
-        kOrig = c.recurse().getElementsByClass('KeySignature')[0]
-        kNew = newScore.recurse().getElementsByClass('KeySignature')[0]
+    kOrig = firstKeySignature(c)
+    kNew = firstKeySignature(newScore)
+    if kOrig is None or kNew is None:
+        print('no key in ', cName)
+    else:
         sKOrig = str(kOrig)
         sKNew = str(kNew)
         if kOrig.sharps != kNew.sharps:
@@ -155,13 +234,8 @@ def runOne(c, cName):
             print('Mode would have been changed from ', sKOrig, sKNew)
             if str(analysisKey) != sKOrig:
                 print("Key mismatch: ", sKOrig, sKNew, str(analysisKey))
-            
-    except IndexError:
-        print('no key in ', cName)
 
-    fNewXml = pOut / (cName.replace('.mxl', '.xml'))
-    newScore.write(fp=fNewXml)
-    musicxml.archiveTools.compressXML(str(fNewXml), deleteOriginal=True)
+    writeMxl(newScore, pOut / cName)
 
 #     for i, pOrig in enumerate(c.parts):
 #         expander = repeat.Expander(pOrig)
@@ -2,6 +2,7 @@
 Experiment in fading from one chord to another
 '''
 from copy import deepcopy
+from functools import lru_cache
 from typing import cast
 
 import math
@@ -9,27 +10,20 @@ import math
 from music21 import *
 
 
+@lru_cache(maxsize=64)
 def smooth01(steps):
     # f(x) = arcsin(2x-1)/pi+1/2
-    out = []
-    for i in range(1, steps+1):
-        frac = i/steps
-        out.append(math.asin(2*frac-1)/math.pi + 1/2)
-    return out
-
-    # return [0] + [math.asin(2*(i/steps)+1)/math.pi + 1/2 for i in range(1, steps-1)] + [1]
-    # return [math.sin((i+1)/steps * math.pi/2) for i in range(steps)]
-    # return [-1*(math.cos((i+1)/steps * math.pi) - 1)/2 for i in range(steps)]
+    # returns a tuple, since the result is cached and shared between callers
+    return tuple(math.asin(2*(i/steps)-1)/math.pi + 1/2 for i in range(1, steps+1))
 
 
 def main():
     reps = 20
     basis = cast(stream.Measure, converter.parse("tinynotation: 2/4 c16 d e f g a c' b")
                  .getElementsByClass('Measure').first())
-    vols = [[1, 0, 1, 0, 1, 0, 1, 0] * reps]
-    smooths = smooth01(reps)
+    vols = (1, 0, 1, 0, 1, 0, 1, 0)
     for i, n in enumerate(basis.notes):
-        n.volume.velocityScalar = vols[0][i]
+        n.volume.velocityScalar = vols[i]
     notes = basis[note.Note]
     notes[0].groups.append('C')
     notes[1].groups.append('D')
@@ -43,7 +37,7 @@ def main():
 
     part = stream.Part()
     for rep_n in range(reps):
-        new_measure = deepcopy(basis)
+        new_measure = clone_measure(basis)
         part.append(new_measure)
 
     fade_note(part, 'F', 2, 8)  # , pos_offset_at_zero=0.25)
@@ -59,6 +53,21 @@ def main():
     part.write('midi', '/Users/cuthbert/Desktop/t1.mid')
 
 
+def clone_measure(basis):
+    '''
+    A cheaper stand-in for deepcopy(basis): the template keeps the clef and
+    meter, and only the pitch, duration, velocity, and groups of each note
+    are carried over.
+    '''
+    new_measure = basis.template(fillWithRests=False)
+    for n in basis.notes:
+        new_note = note.Note(deepcopy(n.pitch), quarterLength=n.quarterLength)
+        new_note.volume.velocityScalar = n.volume.velocityScalar
+        new_note.groups.extend(n.groups)
+        new_measure.insert(basis.elementOffset(n), new_note)
+    return new_measure
+
+
 def fade_note(
     part,
     group_name,
@@ -77,12 +86,20 @@ def fade_note(
     for i, m in enumerate(part.getElementsByClass('Measure')):
         if i < start_rep:
             continue
-        found = m.getElementsByClass(note.Note).getElementsByGroup(group_name)
+        found = list(m.getElementsByClass(note.Note).getElementsByGroup(group_name))
+        if not found:
+            continue
         index_in_smooths = i-start_rep if i < end_rep else end_rep-1-start_rep
         # print(index_in_smooths, smooths)
+        velocity_scalar = smooths[index_in_smooths]
+        position = positions[index_in_smooths]
         for n in found:
-            n.volume.velocityScalar = smooths[index_in_smooths]
-            n.setOffsetBySite(m, n.offset + positions[index_in_smooths])
+            n.volume.velocityScalar = velocity_scalar
+            if position:
+                m.coreSetElementOffset(n, m.elementOffset(n) + position)
+        if position:
+            # moving the notes is batched: the measure is re-sorted only once
+            m.coreElementsChanged()
 
 if __name__ == '__main__':
     # print(smooth01(100))
@@ -8,9 +8,13 @@
 # Copyright:    Copyright © 2010 Michael Scott Asato Cuthbert
 # License:      BSD, see license.txt
 # ------------------------------------------------------------------------------
+import bisect
 import copy
 
-from music21 import note, stream, corpus, converter, voiceLeading, pitch, chord
+from music21 import note, stream, corpus, converter, voiceLeading, pitch, chord, interval
+
+_SATB = frozenset({'soprano', 'alto', 'tenor', 'bass'})
+
 
 def annotateWithGerman():
     '''
@@ -32,37 +36,59 @@ def bachParallels():
     '''
     for fn in corpus.chorales.Iterator(returnType='filename'):
         print(fn)
+        # each chorale is parsed only once per run (music21 keeps its own
+        # pickle cache between runs); the parsed score is not memoized here
+        # because the lyrics added below would accumulate across runs.
         c = corpus.parse(fn)
         displayMe = False
-        for i in range(len(c.parts) - 1):
-            iName = c.parts[i].id
-            if iName.lower() not in ['soprano', 'alto', 'tenor', 'bass']:
-                continue
-            ifn = c.parts[i].flatten().notesAndRests.stream()
-            omi = ifn.offsetMap()
-            for j in range(i + 1, len(c.parts)):
-                jName = c.parts[j].id
-                if jName.lower() not in ['soprano', 'alto', 'tenor', 'bass']:
-                    continue
-
-                jfn = c.parts[j].flatten().notesAndRests.stream()
+        # only the four voices are compared, so no other part is flattened.
+        satbParts = [(partIndex, p) for partIndex, p in enumerate(c.parts)
+                     if p.id.lower() in _SATB]
+        flatNotes = {}
+        flatElements = {}
+        flatOffsets = {}
+        for partIndex, p in satbParts:
+            pfn = p.flatten().notesAndRests.stream()
+            flatNotes[partIndex] = pfn
+            # pfn is sorted by offset, so the element sounding at a given
+            # time can be found by bisecting the list of offsets.
+            flatElements[partIndex] = list(pfn)
+            flatOffsets[partIndex] = [pfn.elementOffset(e) for e in flatElements[partIndex]]
+
+        for satbIndex, (i, _) in enumerate(satbParts[:-1]):
+            omi = flatNotes[i].offsetMap()
+            for j, jPart in satbParts[satbIndex + 1:]:
+                jName = jPart.id
+                jElements = flatElements[j]
+                jOffsets = flatOffsets[j]
                 for k in range(len(omi) - 1):
                     offsetThis = omi[k]
                     offsetNext = omi[k + 1]
                     n1pi = offsetThis.element
                     n2pi = offsetNext.element
-                    n1pj = jfn.getElementsByOffset(offsetStart=offsetThis.endTime - .001,
-                                                   offsetEnd=offsetThis.endTime - .001,
-                                                   mustBeginInSpan=False)[0]
-                    n2pj = jfn.getElementsByOffset(offsetStart=offsetNext.offset,
-                                                   offsetEnd=offsetNext.offset,
-                                                   mustBeginInSpan=False)[0]
+                    # last element beginning before the end of n1pi
+                    n1pjIndex = bisect.bisect_left(jOffsets, offsetThis.endTime) - 1
+                    # last element beginning at or before the start of n2pi
+                    n2pjIndex = bisect.bisect_right(jOffsets, offsetNext.offset) - 1
+                    if n1pjIndex < 0 or n2pjIndex < 0:
+                        continue
+                    n1pj = jElements[n1pjIndex]
+                    n2pj = jElements[n2pjIndex]
                     if n1pj is n2pj:
                         continue  # no oblique motion
                     if n1pi.isRest or n2pi.isRest or n1pj.isRest or n2pj.isRest:
                         continue
                     if n1pi.isChord or n2pi.isChord or n1pj.isChord or n2pj.isChord:
                         continue
+                    # parallel fifths or octaves need both vertical intervals to
+                    # be 7 or 0 semitones (mod 12), which is much cheaper to check
+                    # than building a VoiceLeadingQuartet.
+                    iv1 = int(abs(n1pi.pitch.ps - n1pj.pitch.ps)) % 12
+                    if iv1 not in (0, 7):
+                        continue
+                    iv2 = int(abs(n2pi.pitch.ps - n2pj.pitch.ps)) % 12
+                    if iv2 != iv1:
+                        continue
 
                     vlq = voiceLeading.VoiceLeadingQuartet(n1pi, n2pi, n1pj, n2pj)
                     if vlq.parallelMotion('P8') is False and vlq.parallelMotion('P5') is False:
@@ -126,9 +152,11 @@ def towersOfHanoi(show=False, numParts=6, transpose=False):
             pitchCycle = copy.deepcopy(oddPitches)
 
         if transpose and i != 1:
+            # build the interval once per part rather than once per pitch
+            downP4s = interval.Interval(-5 * (i - 1))
             for pe in pitchCycle:  # take down P4s
-                pe.transpose(-5 * (i - 1), inPlace=True)
-            firstNote.transpose(-5 * (i - 1), inPlace=True)
+                pe.transpose(downP4s, inPlace=True)
+            firstNote.transpose(downP4s, inPlace=True)
 
 
 
@@ -168,9 +196,8 @@ def pcsFromHumdrum(show=False):
     from music21.humdrum import testFiles
     myScore = converter.parse(testFiles.mazurka6)
     onePartScore = myScore.chordify()
-    output = ""
-    for thisChord in onePartScore.flatten().getElementsByClass(chord.Chord):
-        output = output + thisChord.forteName + "\n"
+    output = "".join(thisChord.forteName + "\n"
+                     for thisChord in onePartScore.flatten().getElementsByClass(chord.Chord))
     if show:
         print(output)
 
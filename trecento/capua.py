@@ -22,10 +22,16 @@ and, by running the :meth:`~music21.stream.Stream.attachIntervalsBetweenStreams`
 method of :class:`~music21.stream.Stream` objects, seeing how well these rules correct certain
 harmonic problems in the music.
 '''
+import collections
+import concurrent.futures
+import copy
+import functools
 import unittest
 
 from music21 import exceptions21
 from . import cadencebook
+from . import polyphonicSnippet
+from music21 import note
 from music21 import stream
 from music21 import pitch
 from music21 import interval
@@ -40,6 +46,14 @@ RULE_THREE = 4
 RULE_FOUR_A = 8
 RULE_FOUR_B = 16
 
+# the ficta that the rules can add, built once; every note gets its own copy,
+# since an Accidental keeps a reference to the pitch that it is attached to.
+_FICTA_ACCIDENTALS = {
+    'sharp': pitch.Accidental('sharp'),
+    'flat': pitch.Accidental('flat'),
+    'natural': pitch.Accidental('natural'),
+}
+
 
 class CapuaException(exceptions21.Music21Exception):
     pass
@@ -90,15 +104,205 @@ def applyCapuaToStream(thisStream):
     Runs in place.
     '''
     for n in thisStream.notes:
-        if hasattr(n.editorial, 'ficta'):
-            n.editorial.pmfcFicta = n.editorial.ficta
-            clearAccidental(n)
+        # 'ficta' is one of Editorial's predefined Nones, so every note has
+        # one to move (even if it is None), and every accidental is cleared.
+        n.editorial.pmfcFicta = n.editorial.ficta
+        clearAccidental(n)
+
+    # flatten once and share the notes with clearFicta and all the rules
+    notesAndRests = list(thisStream.flat.notesAndRests)
+    _clearFicta(notesAndRests)
+    if len(notesAndRests) < 3:
+        return  # every rule looks at three or more notes
+
+    # a rule that removes a flat updates the melody, so that the later rules
+    # see the change just as they would if run one by one.
+    melody = _CapuaMelody(notesAndRests)
+    _capuaRuleOne(melody)
+    _capuaRuleTwo(melody)
+    _capuaRuleThree(melody)
+    _capuaRuleFourB(melody)
+    melody.writeEdits()
+
+
+# directed names of the melodic seconds and thirds, keyed by the number of
+# diatonic steps and the number of semitones between the two pitches.
+_DIRECTED_NAMES = {
+    (1, 1): 'm2',
+    (1, 2): 'M2',
+    (-1, -1): 'm-2',
+    (-1, -2): 'M-2',
+    (2, 3): 'm3',
+    (2, 4): 'M3',
+    (-2, -3): 'm-3',
+    (-2, -4): 'M-3',
+}
+
+
+class _CapuaMelody:
+    '''
+    Plain lists of the attributes that the Capua rules look at, taken once
+    from a flat list of notes and rests, so that the rules scan lists of
+    numbers and strings instead of going back to the music21 objects at every
+    position.
+
+    `names` holds the directed name of the melodic interval from each note to
+    the next if it is a second or third, or None if it is any other interval
+    or if either one is a rest.  These are the only intervals that the rules
+    look for, so no Interval objects need to be built.
+
+    >>> from music21 import converter
+    >>> s = converter.parse('tinyNotation: 4/4 g4 f4 r4 b-4 a4 f#4')
+    >>> melody = _CapuaMelody(list(s.flat.notesAndRests))
+    >>> melody.names
+    ['M-2', None, None, 'm-2', 'm-3']
+    >>> melody.accidentalNames
+    [None, None, None, 'flat', None, 'sharp']
+
+    A rule that removes a flat calls `removeFlat` so that the data (and
+    the later rules) see the change:
+
+    >>> melody.removeFlat(3)
+    >>> melody.names
+    ['M-2', None, None, 'M-2', 'm-3']
+    >>> melody.accidentalNames
+    [None, None, None, None, None, 'sharp']
+
+    The notes themselves are left alone while the rules run.  What the rules
+    find is recorded with `recordMatches`, and `writeEdits` then puts the
+    result of all of them onto the notes at once:
+
+    >>> s.flat.notes[2].pitch.accidental
+    <music21.pitch.Accidental flat>
+    >>> melody.writeEdits()
+    >>> s.flat.notes[2].pitch.accidental is None
+    True
+    >>> s.flat.notes[2].editorial.savedAccidental
+    <music21.pitch.Accidental flat>
+    '''
+    def __init__(self, ssn):
+        self.notes = ssn
+        self.isRest = []
+        self.diatonicNoteNums = []
+        self.pitchSpaces = []
+        self.accidentalNames = []
+        self.steps = []
+        # the edits waiting for writeEdits, by note index
+        self.removedFlats = set()
+        self.ruleNumbers = {}
+        self.fictaNames = {}
+        self.colors = {}
+        isRest = self.isRest
+        diatonicNoteNums = self.diatonicNoteNums
+        pitchSpaces = self.pitchSpaces
+        accidentalNames = self.accidentalNames
+        steps = self.steps
+        for n in ssn:
+            if n.isRest:
+                isRest.append(True)
+                diatonicNoteNums.append(None)
+                pitchSpaces.append(None)
+                accidentalNames.append(None)
+                steps.append(None)
+                continue
+            p = n.pitch
+            accidental = p.accidental
+            isRest.append(False)
+            diatonicNoteNums.append(p.diatonicNoteNum)
+            pitchSpaces.append(p.ps)
+            accidentalNames.append(accidental.name if accidental is not None else None)
+            steps.append(p.step)
+        self.names = [self.directedName(i) for i in range(len(ssn) - 1)]
+
+    def directedName(self, i):
+        '''
+        Returns the directed name of the interval from note i to note i + 1,
+        as described for `names`.
+        '''
+        if self.isRest[i] or self.isRest[i + 1]:
+            return None
+        return _DIRECTED_NAMES.get((self.diatonicNoteNums[i + 1] - self.diatonicNoteNums[i],
+                                    self.pitchSpaces[i + 1] - self.pitchSpaces[i]))
+
+    def removeFlat(self, index):
+        '''
+        Records that the flat on the note at `index` has been removed, and
+        recomputes the intervals on either side of it.
+        '''
+        self.removedFlats.add(index)
+        self.accidentalNames[index] = None
+        self.pitchSpaces[index] += 1
+        if index > 0:
+            self.names[index - 1] = self.directedName(index - 1)
+        if index < len(self.names):
+            self.names[index] = self.directedName(index)
+
+    def recordMatches(self, matches, ruleNumber, changedOffset, colors):
+        '''
+        Records the matches found by one of the `_scanRule` functions.
+        The note `changedOffset` notes into each pattern gets `ruleNumber`
+        added to its `editorial.capuaRuleNumber` and the ficta, and the notes
+        of the pattern get the colors in `colors[fictaName]`.  Later matches
+        replace the ficta and colors of earlier ones.
+        '''
+        ruleNumbers = self.ruleNumbers
+        fictaNames = self.fictaNames
+        noteColors = self.colors
+        for i, fictaName in matches:
+            changedIndex = i + changedOffset
+            ruleNumbers[changedIndex] = ruleNumbers.get(changedIndex, 0) + ruleNumber
+            fictaNames[changedIndex] = fictaName
+            for j, color in enumerate(colors[fictaName]):
+                noteColors[i + j] = color
+
+    def writeEdits(self):
+        '''
+        Puts the recorded edits onto the notes: each removed flat is moved to
+        `editorial.savedAccidental`, the ficta goes to `editorial.ficta` and
+        `editorial.capuaFicta`, and the rule numbers and colors are set.
+        '''
+        notes = self.notes
+        for index in self.removedFlats:
+            p = notes[index].pitch
+            notes[index].editorial.savedAccidental = p.accidental
+            p.accidental = None
+        for index, ruleNumber in self.ruleNumbers.items():
+            editorial = notes[index].editorial
+            if 'capuaRuleNumber' in editorial:
+                editorial.capuaRuleNumber += ruleNumber
+            else:
+                editorial.capuaRuleNumber = ruleNumber
+        for index, fictaName in self.fictaNames.items():
+            editorial = notes[index].editorial
+            ficta = _FICTA_ACCIDENTALS[fictaName]
+            editorial.ficta = copy.copy(ficta)
+            editorial.capuaFicta = copy.copy(ficta)
+        for index, color in self.colors.items():
+            notes[index].style.color = color
+        self.removedFlats = set()
+        self.ruleNumbers = {}
+        self.fictaNames = {}
+        self.colors = {}
+
+
+def _patternStarts(names, firstName, stop):
+    '''
+    Yields, in order, each index below `stop` at which `names` has `firstName`,
+    so that a rule only looks at the places where its pattern could begin.
+    The list is searched again after each index is yielded, so changes that
+    the rule makes to `names` along the way are seen.
 
-    clearFicta(thisStream)
-    capuaRuleOne(thisStream)
-    capuaRuleTwo(thisStream)
-    capuaRuleThree(thisStream)
-    capuaRuleFourB(thisStream)
+    >>> list(_patternStarts(['M2', 'm2', 'M2', None, 'M2'], 'M2', 4))
+    [0, 2]
+    '''
+    i = 0
+    while True:
+        try:
+            i = names.index(firstName, i, stop)
+        except ValueError:
+            return
+        yield i
+        i += 1
 
 
 def capuaRuleOne(srcStream):
@@ -114,52 +318,65 @@ def capuaRuleOne(srcStream):
 
     Returns the number of notes that were changed (not counting notes whose colors were changed).
     '''
-    numChanged = 0
+    ssn = list(srcStream.flat.notesAndRests)
+    if len(ssn) < 3:
+        return 0  # too short for the pattern
+    melody = _CapuaMelody(ssn)
+    numChanged = _capuaRuleOne(melody)
+    melody.writeEdits()
+    return numChanged
 
-    ssn = srcStream.flat.notesAndRests
-    for i in range(len(ssn) - 2):
-        n1 = ssn[i]
-        n2 = ssn[i + 1]
-        n3 = ssn[i + 2]
 
-        if n1.isRest or n2.isRest or n3.isRest:
-            continue
+def _capuaRuleOne(melody):
+    '''
+    Runs capuaRuleOne on a `_CapuaMelody`, recording what it changes in the
+    melody for `writeEdits`.
+    '''
+    matches = _scanRuleOne(melody)
+    melody.recordMatches(matches, RULE_ONE, 1, {
+        'natural': ('blue', 'forestGreen', 'blue'),
+        'sharp': ('blue', 'ForestGreen', 'blue'),
+    })
+    return len(matches)
 
-        i1 = interval.notesToInterval(n1, n2)
-        i2 = interval.notesToInterval(n2, n3)
 
-        if (n1.pitch.accidental is not None
-                or n3.pitch.accidental is not None):
+def _scanRuleOne(melody):
+    '''
+    Finds the places where capuaRuleOne applies, looking only at the data
+    in `melody`.  Returns a list of (index of the first note of the pattern,
+    name of the ficta) for `_CapuaMelody.recordMatches`.
+    '''
+    numNotes = len(melody.isRest)
+    names = melody.names
+    accidentalNames = melody.accidentalNames
+    steps = melody.steps
+    matches = []
+    # names only change after a match, so if the rest of the pattern is
+    # missing now, nothing can match at all
+    if 'M2' not in names:
+        return matches
+    # windows with a rest never match, since the intervals to and from
+    # a rest are None
+    for i in _patternStarts(names, 'M-2', numNotes - 2):
+        # e.g. G, F, G => G, F#, G
+        if names[i + 1] != 'M2':
+            continue
+
+        if (accidentalNames[i] is not None
+                or accidentalNames[i + 2] is not None):
             continue
 
         # never seems to improve things...
-        if n2.step == 'A' or n2.step == 'D':
+        if steps[i + 1] == 'A' or steps[i + 1] == 'D':
             continue
 
-        # e.g. G, F, G => G, F#, G
-        if (i1.directedName == 'M-2'
-                and i2.directedName == 'M2'):
-            numChanged += 1
-            if 'capuaRuleNumber' in n2.editorial:
-                n2.editorial.capuaRuleNumber += RULE_ONE
-            else:
-                n2.editorial.capuaRuleNumber = RULE_ONE
-            if n2.pitch.accidental is not None and n2.pitch.accidental.name == 'flat':
-                n2.editorial.savedAccidental = n2.pitch.accidental
-                n2.pitch.accidental = None
-                n2.editorial.ficta = pitch.Accidental('natural')
-                n2.editorial.capuaFicta = pitch.Accidental('natural')
-                n1.style.color = 'blue'
-                n2.style.color = 'forestGreen'
-                n3.style.color = 'blue'
-            else:
-                n2.editorial.ficta = pitch.Accidental('sharp')
-                n2.editorial.capuaFicta = pitch.Accidental('sharp')
-                n1.style.color = 'blue'
-                n2.style.color = 'ForestGreen'
-                n3.style.color = 'blue'
+        if accidentalNames[i + 1] == 'flat':
+            melody.removeFlat(i + 1)
+            matches.append((i, 'natural'))
+        else:
+            matches.append((i, 'sharp'))
 
-    return numChanged
+    return matches
 
 
 def capuaRuleTwo(srcStream):
@@ -172,63 +389,62 @@ def capuaRuleTwo(srcStream):
 
     returns the number of times any note was changed
     '''
-    numChanged = 0
+    ssn = list(srcStream.flat.notesAndRests)
+    if len(ssn) < 4:
+        return 0  # too short for the pattern
+    melody = _CapuaMelody(ssn)
+    numChanged = _capuaRuleTwo(melody)
+    melody.writeEdits()
+    return numChanged
+
+
+def _capuaRuleTwo(melody):
+    '''
+    Runs capuaRuleTwo on a `_CapuaMelody`; see `_capuaRuleOne`.
+    '''
+    matches = _scanRuleTwo(melody)
+    melody.recordMatches(matches, RULE_TWO, 2, {
+        'natural': ('purple', 'purple', 'ForestGreen', 'purple'),
+        'sharp': ('purple', 'purple', 'ForestGreen', 'purple'),
+    })
+    return len(matches)
 
-    ssn = srcStream.flat.notesAndRests
-    for i in range(len(ssn) - 3):
-        n1 = ssn[i]
-        n2 = ssn[i + 1]
-        n3 = ssn[i + 2]
-        n4 = ssn[i + 3]
 
-        if (n1.isRest
-                or n2.isRest
-                or n3.isRest
-                or n4.isRest):
+def _scanRuleTwo(melody):
+    '''
+    Finds the places where capuaRuleTwo applies, looking only at the data
+    in `melody`.  Returns a list of (index of the first note of the pattern,
+    name of the ficta) for `_CapuaMelody.recordMatches`.
+    '''
+    numNotes = len(melody.isRest)
+    names = melody.names
+    accidentalNames = melody.accidentalNames
+    steps = melody.steps
+    matches = []
+    if 'm2' not in names:
+        return matches
+    for i in _patternStarts(names, 'M2', numNotes - 3):
+        # e.g., D E F G => D E F# G
+        #    or F A Bb C => F A B C
+        if names[i + 1] != 'm2' or names[i + 2] != 'M2':
             continue
 
-        i1 = interval.notesToInterval(n1, n2)
-        i2 = interval.notesToInterval(n2, n3)
-        i3 = interval.notesToInterval(n3, n4)
-
-        if (n1.pitch.accidental is not None
-                or n2.pitch.accidental is not None
-                or n4.pitch.accidental is not None):
+        if (accidentalNames[i] is not None
+                or accidentalNames[i + 1] is not None
+                or accidentalNames[i + 3] is not None):
             continue
 
         # never seems to improve things...
-        if n3.step == 'A' or n3.step == 'D':
+        if steps[i + 2] == 'A' or steps[i + 2] == 'D':
             continue
 
-        # e.g., D E F G => D E F# G
-        #    or F A Bb C => F A B C
-        if (i1.directedName == 'M2'
-                and i2.directedName == 'm2'
-                and i3.directedName == 'M2'):
-            numChanged += 1
-            if 'capuaRuleNumber' in n3.editorial:
-                n3.editorial.capuaRuleNumber += RULE_TWO
-            else:
-                n3.editorial.capuaRuleNumber = RULE_TWO
-
-            if n3.pitch.accidental is not None and n3.pitch.accidental.name == 'flat':
-                n3.editorial.savedAccidental = n3.pitch.accidental
-                n3.pitch.accidental = None
-                n3.editorial.ficta = pitch.Accidental('natural')
-                n3.editorial.capuaFicta = pitch.Accidental('natural')
-                n1.style.color = 'purple'
-                n2.style.color = 'purple'
-                n3.style.color = 'ForestGreen'
-                n4.style.color = 'purple'
-            else:
-                n3.editorial.ficta = pitch.Accidental('sharp')
-                n3.editorial.capuaFicta = pitch.Accidental('sharp')
-                n1.style.color = 'purple'
-                n2.style.color = 'purple'
-                n3.style.color = 'ForestGreen'
-                n4.style.color = 'purple'
+        if accidentalNames[i + 2] == 'flat':
+            melody.removeFlat(i + 2)
+            matches.append((i, 'natural'))
+        else:
+            matches.append((i, 'sharp'))
 
-    return numChanged
+    return matches
 
 
 def capuaRuleThree(srcStream):
@@ -243,44 +459,56 @@ def capuaRuleThree(srcStream):
 
     returns the number of times a note was changed
     '''
-    numChanged = 0
+    ssn = list(srcStream.flat.notesAndRests)
+    if len(ssn) < 3:
+        return 0  # too short for the pattern
+    melody = _CapuaMelody(ssn)
+    numChanged = _capuaRuleThree(melody)
+    melody.writeEdits()
+    return numChanged
 
-    ssn = srcStream.flat.notesAndRests
-    for i in range(len(ssn) - 2):
-        n1 = ssn[i]
-        n2 = ssn[i + 1]
-        n3 = ssn[i + 2]
 
-        if n1.isRest or n2.isRest or n3.isRest:
-            continue
+def _capuaRuleThree(melody):
+    '''
+    Runs capuaRuleThree on a `_CapuaMelody`; see `_capuaRuleOne`.
+    '''
+    matches = _scanRuleThree(melody)
+    melody.recordMatches(matches, RULE_THREE, 1, {
+        'sharp': ('DeepPink', 'ForestGreen', 'DeepPink'),
+    })
+    return len(matches)
 
-        i1 = interval.notesToInterval(n1, n2)
-        i2 = interval.notesToInterval(n2, n3)
 
-        if (n1.pitch.accidental is not None
-                or n2.pitch.accidental is not None
-                or n3.pitch.accidental is not None):
+def _scanRuleThree(melody):
+    '''
+    Finds the places where capuaRuleThree applies, looking only at the data
+    in `melody`.  Returns a list of (index of the first note of the pattern,
+    name of the ficta) for `_CapuaMelody.recordMatches`.
+    '''
+    numNotes = len(melody.isRest)
+    names = melody.names
+    accidentalNames = melody.accidentalNames
+    steps = melody.steps
+    matches = []
+    if 'M2' not in names:
+        return matches
+    for i in _patternStarts(names, 'M-3', numNotes - 2):
+        # e.g., E C D => E C# D
+        if names[i + 1] != 'M2':
+            continue
+
+        if (accidentalNames[i] is not None
+                or accidentalNames[i + 1] is not None
+                or accidentalNames[i + 2] is not None):
             continue
 
         # never seems to improve things...
-        if n2.step == 'A' or n2.step == 'D':
+        if steps[i + 1] == 'A' or steps[i + 1] == 'D':
             continue
 
-        # e.g., E C D => E C# D
-        if (i1.directedName == 'M-3'
-                and i2.directedName == 'M2'):
-            numChanged += 1
-            if 'capuaRuleNumber' in n2.editorial:
-                n2.editorial.capuaRuleNumber += RULE_THREE
-            else:
-                n2.editorial.capuaRuleNumber = RULE_THREE
-            n2.editorial.ficta = pitch.Accidental('sharp')
-            n2.editorial.capuaFicta = pitch.Accidental('sharp')
-            n1.style.color = 'DeepPink'
-            n2.style.color = 'ForestGreen'
-            n3.style.color = 'DeepPink'
+        matches.append((i, 'sharp'))
 
-    return numChanged
+    return matches
 
 
 def capuaRuleFourA(srcStream):
@@ -297,43 +525,56 @@ def capuaRuleFourA(srcStream):
     This rule is a less likely interpretation of the ambiguous rule 4, thus
     applyCapuaToStream uses capuaRuleFourB instead.
     '''
-    numChanged = 0
+    ssn = list(srcStream.flat.notesAndRests)
+    if len(ssn) < 3:
+        return 0  # too short for the pattern
+    melody = _CapuaMelody(ssn)
+    numChanged = _capuaRuleFourA(melody)
+    melody.writeEdits()
+    return numChanged
 
-    ssn = srcStream.flat.notesAndRests
-    for i in range(len(ssn) - 2):
-        n1 = ssn[i]
-        n2 = ssn[i + 1]
-        n3 = ssn[i + 2]
 
-        if n1.isRest or n2.isRest or n3.isRest:
-            continue
+def _capuaRuleFourA(melody):
+    '''
+    Runs capuaRuleFourA on a `_CapuaMelody`; see `_capuaRuleOne`.
+    '''
+    matches = _scanRuleFourA(melody)
+    melody.recordMatches(matches, RULE_FOUR_A, 1, {
+        'flat': ('orange', 'ForestGreen', 'orange'),
+    })
+    return len(matches)
 
-        i1 = interval.notesToInterval(n1, n2)
-        i2 = interval.notesToInterval(n2, n3)
 
-        if (n1.pitch.accidental is not None
-                or n2.pitch.accidental is not None
-                or n3.pitch.accidental is not None):
+def _scanRuleFourA(melody):
+    '''
+    Finds the places where capuaRuleFourA applies, looking only at the data
+    in `melody`.  Returns a list of (index of the first note of the pattern,
+    name of the ficta) for `_CapuaMelody.recordMatches`.
+    '''
+    numNotes = len(melody.isRest)
+    names = melody.names
+    accidentalNames = melody.accidentalNames
+    steps = melody.steps
+    matches = []
+    if 'M-2' not in names:
+        return matches
+    for i in _patternStarts(names, 'm-3', numNotes - 2):
+        # e.g., D B A => D Bb A
+        if names[i + 1] != 'M-2':
+            continue
+
+        if (accidentalNames[i] is not None
+                or accidentalNames[i + 1] is not None
+                or accidentalNames[i + 2] is not None):
             continue
 
         # never seems to improve things...
-        if n2.step == 'A' or n2.step == 'D':
+        if steps[i + 1] == 'A' or steps[i + 1] == 'D':
             continue
 
-        # e.g., D B A => D Bb A
-        if i1.directedName == 'm-3' and i2.directedName == 'M-2':
-            numChanged += 1
-            if 'capuaRuleNumber' in n2.editorial:
-                n2.editorial.capuaRuleNumber += RULE_FOUR_A
-            else:
-                n2.editorial.capuaRuleNumber = RULE_FOUR_A
-            n2.editorial.ficta = pitch.Accidental('flat')
-            n2.editorial.capuaFicta = pitch.Accidental('flat')
-            n1.style.color = 'orange'
-            n2.style.color = 'ForestGreen'
-            n3.style.color = 'orange'
+        matches.append((i, 'flat'))
 
-    return numChanged
+    return matches
 
 
 def capuaRuleFourB(srcStream):
@@ -349,50 +590,60 @@ def capuaRuleFourB(srcStream):
 
     returns the number of times a note was changed.
     '''
-    numChanged = 0
-    ssn = srcStream.flat.notesAndRests
-    for i in range(len(ssn) - 2):
-        n1 = ssn[i]
-        n2 = ssn[i + 1]
-        n3 = ssn[i + 2]
+    ssn = list(srcStream.flat.notesAndRests)
+    if len(ssn) < 3:
+        return 0  # too short for the pattern
+    melody = _CapuaMelody(ssn)
+    numChanged = _capuaRuleFourB(melody)
+    melody.writeEdits()
+    return numChanged
 
-        if n1.isRest or n2.isRest or n3.isRest:
-            continue
 
-        i1 = interval.notesToInterval(n1, n2)
-        i2 = interval.notesToInterval(n2, n3)
+def _capuaRuleFourB(melody):
+    '''
+    Runs capuaRuleFourB on a `_CapuaMelody`; see `_capuaRuleOne`.
+    '''
+    matches = _scanRuleFourB(melody)
+    melody.recordMatches(matches, RULE_FOUR_B, 1, {
+        'natural': ('orange', 'green', 'orange'),
+        'sharp': ('orange', 'green', 'orange'),
+    })
+    return len(matches)
+
 
-        if (n1.pitch.accidental is not None
-                or n3.pitch.accidental is not None):
+def _scanRuleFourB(melody):
+    '''
+    Finds the places where capuaRuleFourB applies, looking only at the data
+    in `melody`.  Returns a list of (index of the first note of the pattern,
+    name of the ficta) for `_CapuaMelody.recordMatches`.
+    '''
+    numNotes = len(melody.isRest)
+    names = melody.names
+    accidentalNames = melody.accidentalNames
+    steps = melody.steps
+    matches = []
+    if 'M2' not in names:
+        return matches
+    for i in _patternStarts(names, 'm3', numNotes - 2):
+        # e.g., D F G => D F# G  or G Bb C => G B C
+        if names[i + 1] != 'M2':
+            continue
+
+        if (accidentalNames[i] is not None
+                or accidentalNames[i + 2] is not None):
             continue
 
         # never seems to improve things...
-        if n2.step == 'A' or n2.step == 'D':
+        if steps[i + 1] == 'A' or steps[i + 1] == 'D':
             continue
 
-        # e.g., D F G => D F# G  or G Bb C => G B C
-        if i1.directedName == 'm3' and i2.directedName == 'M2':
-            numChanged += 1
-            if 'capuaRuleNumber' in n2.editorial:
-                n2.editorial.capuaRuleNumber += RULE_FOUR_B
-            else:
-                n2.editorial.capuaRuleNumber = RULE_FOUR_B
-            if n2.pitch.accidental is not None and n2.pitch.accidental.name == 'flat':
-                n2.editorial.savedAccidental = n2.pitch.accidental
-                n2.pitch.accidental = None
-                n2.editorial.ficta = pitch.Accidental('natural')
-                n2.editorial.capuaFicta = pitch.Accidental('natural')
-                n1.style.color = 'orange'
-                n2.style.color = 'green'
-                n3.style.color = 'orange'
-            else:
-                n2.editorial.ficta = pitch.Accidental('sharp')
-                n2.editorial.capuaFicta = pitch.Accidental('sharp')
-                n1.style.color = 'orange'
-                n2.style.color = 'green'
-                n3.style.color = 'orange'
+        if accidentalNames[i + 1] == 'flat':
+            melody.removeFlat(i + 1)
+            matches.append((i, 'natural'))
+        else:
+            matches.append((i, 'sharp'))
 
-    return numChanged
+    return matches
 
 
 def clearFicta(srcStream1):
@@ -401,10 +652,21 @@ def clearFicta(srcStream1):
     note.editorial.savedFicta.
     '''
 
-    for n2 in srcStream1.flat.notes:
-        if hasattr(n2.editorial, 'ficta'):
-            n2.editorial.savedFicta = n2.editorial.ficta
-        n2.editorial.ficta = None
+    _clearFicta(srcStream1.flat.notes)
+
+
+def _clearFicta(notes):
+    '''
+    Runs clearFicta on an iterable of notes that has already been flattened,
+    skipping any rests.
+    '''
+    for n2 in notes:
+        if n2.isRest:
+            continue
+        editorial = n2.editorial
+        # every note has a ficta (a predefined None), so every note saves one
+        editorial.savedFicta = editorial.ficta
+        editorial.ficta = None
 
 
 def restoreFicta(srcStream1):
@@ -413,8 +675,9 @@ def restoreFicta(srcStream1):
     back to note.editorial.ficta.
     '''
     for n2 in srcStream1:
-        if hasattr(n2.editorial, 'savedFicta') and n2.editorial.savedFicta is not None:
-            n2.editorial.ficta = n2.editorial.savedFicta
+        savedFicta = n2.editorial.get('savedFicta')
+        if savedFicta is not None:
+            n2.editorial.ficta = savedFicta
             n2.editorial.savedFicta = None
 
 
@@ -433,7 +696,7 @@ def restoreAccidental(note1):
     takes `Note.editorial.savedAccidental` and moves it back
     to the `Note.pitch.accidental`
     '''
-    if hasattr(note1.editorial, 'savedAccidental'):
+    if 'savedAccidental' in note1.editorial:
         note1.pitch.accidental = note1.editorial.savedAccidental
         note1.editorial.savedAccidental = None
 
@@ -453,10 +716,10 @@ def pmfcFictaToAccidental(note1):
     Moves any ficta in `Note.editorial.pmfcFicta` to the `Note.pitch.accidental`
     object and saves the previous accidental by calling `clearAccidental()` first.
     '''
-    if (hasattr(note1.editorial, 'pmfcFicta')
-            and note1.editorial.pmfcFicta is not None):
+    pmfcFicta = note1.editorial.get('pmfcFicta')
+    if pmfcFicta is not None:
         clearAccidental(note1)
-        note1.pitch.accidental = note1.editorial.pmfcFicta
+        note1.pitch.accidental = pmfcFicta
 
 
 def capuaFictaToAccidental(note1):
@@ -465,10 +728,10 @@ def capuaFictaToAccidental(note1):
     `Note.pitch.accidental` object.  Saves the previous accidental by calling
     `clearAccidental` first.
     '''
-    if (hasattr(note1.editorial, 'capuaFicta')
-            and note1.editorial.capuaFicta is not None):
+    capuaFicta = note1.editorial.get('capuaFicta')
+    if capuaFicta is not None:
         clearAccidental(note1)
-        note1.pitch.accidental = note1.editorial.capuaFicta
+        note1.pitch.accidental = capuaFicta
 
 
 def evaluateRules(srcStream1, srcStream2):
@@ -514,7 +777,9 @@ def evaluateCapuaTwoStreams(srcStream1, srcStream2):
     for note2 in srcStream2:
         capuaFictaToAccidental(note2)
     srcStream1Count = compareOnesrcStream(srcStream1, srcStream2, 'capua2srcStream')
-    srcStream2Count = compareOnesrcStream(srcStream2, srcStream1, 'capua2srcStream')
+    # the first comparison attached the intervals in both directions
+    srcStream2Count = compareOnesrcStream(srcStream2, srcStream1, 'capua2srcStream',
+                                          alreadyAttached=True)
     for note1 in srcStream1:
         restoreAccidental(note1)
     for note2 in srcStream2:
@@ -558,10 +823,16 @@ def evaluateWithoutFicta(srcStream1, srcStream2):
     return noneProfile1
 
 
-PerfectCons = ['P1', 'P5', 'P8']
-ImperfCons = ['m3', 'M3', 'm6', 'M6']
-Others = ['m2', 'M2', 'A2', 'd3', 'A3', 'd4', 'P4', 'A4', 'd5', 'A5', 'd6',
-          'A6', 'd7', 'm7', 'M7', 'A7']
+PerfectCons = frozenset(['P1', 'P5', 'P8'])
+ImperfCons = frozenset(['m3', 'M3', 'm6', 'M6'])
+Others = frozenset(['m2', 'M2', 'A2', 'd3', 'A3', 'd4', 'P4', 'A4', 'd5', 'A5', 'd6',
+                    'A6', 'd7', 'm7', 'M7', 'A7'])
+
+# the category returned by getIntervalType for each interval name
+_INTERVAL_TYPES = {}
+_INTERVAL_TYPES.update((name, 'perfect cons') for name in PerfectCons)
+_INTERVAL_TYPES.update((name, 'imperfect cons') for name in ImperfCons)
+_INTERVAL_TYPES.update((name, 'dissonance') for name in Others)
 
 PERFCONS = 1
 IMPERFCONS = 2
@@ -589,27 +860,38 @@ def compareThreeFictas(srcStream1, srcStream2):
     srcStream2.attachIntervalsBetweenStreams(srcStream1)
 
     for note1 in srcStream1.notes:
-        if hasattr(note1.editorial.harmonicInterval, 'name'):
-            note1.editorial.normalHarmonicInterval = note1.editorial.harmonicInterval.name
-
-        if 'pmfcFicta' in note1.editorial:
-            pmfcFictaToAccidental(note1)
-            note1.editorial.harmonicInterval.reinit()
-            if hasattr(note1.editorial.harmonicInterval, 'name'):
-                note1.editorial.pmfcHarmonicInterval = note1.editorial.harmonicInterval.name
-            restoreAccidental(note1)
-        else:
-            if hasattr(note1.editorial.harmonicInterval, 'name'):
-                note1.editorial.pmfcHarmonicInterval = note1.editorial.harmonicInterval.name
-        if 'capuaFicta' in note1.editorial:
-            capuaFictaToAccidental(note1)
-            note1.editorial.harmonicInterval.reinit()
-            if hasattr(note1.editorial.harmonicInterval, 'name'):
-                note1.editorial.capuaHarmonicInterval = note1.editorial.harmonicInterval.name
-            restoreAccidental(note1)
-        else:
-            if hasattr(note1.editorial.harmonicInterval, 'name'):
-                note1.editorial.capuaHarmonicInterval = note1.editorial.harmonicInterval.name
+        harmonicInterval = note1.editorial.harmonicInterval
+        if harmonicInterval is None:
+            continue  # a rest in the other voice
+        note1.editorial.normalHarmonicInterval = harmonicInterval.name
+        note1.editorial.pmfcHarmonicInterval = _harmonicIntervalNameWithFicta(
+            harmonicInterval, note1.editorial.get('pmfcFicta'))
+        note1.editorial.capuaHarmonicInterval = _harmonicIntervalNameWithFicta(
+            harmonicInterval, note1.editorial.get('capuaFicta'))
+
+
+def _harmonicIntervalNameWithFicta(harmonicInterval, ficta):
+    '''
+    Returns the name that `harmonicInterval` would have if `ficta` were the
+    accidental of its first pitch, or its current name if `ficta` is None.
+    Works on a copy of the pitch, so neither the note nor the interval is changed.
+
+    >>> from music21 import note
+    >>> n1 = note.Note('F4')
+    >>> n2 = note.Note('D4')
+    >>> harmonicInterval = interval.Interval(n1, n2)
+    >>> _harmonicIntervalNameWithFicta(harmonicInterval, pitch.Accidental('sharp'))
+    'M3'
+    >>> _harmonicIntervalNameWithFicta(harmonicInterval, None)
+    'm3'
+    >>> n1.pitch.accidental is None
+    True
+    '''
+    if ficta is None:
+        return harmonicInterval.name
+    startPitch = copy.deepcopy(harmonicInterval.noteStart.pitch)
+    startPitch.accidental = ficta.name
+    return interval.Interval(startPitch, harmonicInterval.noteEnd.pitch).name
 
 
 def compareSrcStreamCapuaToEditor(srcStream1):
@@ -620,20 +902,7 @@ def compareSrcStreamCapuaToEditor(srcStream1):
     the Capua program altered, how many PMFC but not Capua altered and how
     many both altered.
     '''
-
-    totalDict = {
-        'totalNotes': 0,
-        'pmfcAlt': 0,
-        'capuaAlt': 0,
-        'pmfcNotCapua': 0,
-        'capuaNotPmfc': 0,
-        'pmfcAndCapua': 0,
-        }
-    for note1 in srcStream1.flat.notesAndRests:
-        thisDict = compareNoteCapuaToEditor(note1)
-        for thisKey in thisDict:
-            totalDict[thisKey] += thisDict[thisKey]
-    return totalDict
+    return _countFictas(srcStream1.flat.notesAndRests)
 
 
 def compareNoteCapuaToEditor(note1):
@@ -643,34 +912,44 @@ def compareNoteCapuaToEditor(note1):
     the Capua program altered, how many PMFC but not Capua altered and how
     many both altered.
 
-    To be added up by compareSrcStreamCapuaToEditor.  To be run after applyCapua.
+    To be run after applyCapua.
     '''
-    statsDict = {
-        'totalNotes': 0,
-        'pmfcAlt': 0,
-        'capuaAlt': 0,
-        'pmfcNotCapua': 0,
-        'capuaNotPmfc': 0,
-        'pmfcAndCapua': 0,
-        }
+    return _countFictas([note1])
+
 
-    if note1.isRest:
-        return statsDict
-    statsDict['totalNotes'] += 1
-    if 'pmfcFicta' in note1.editorial and 'capuaFicta' in note1.editorial:
-        statsDict['pmfcAlt'] += 1
-        statsDict['capuaAlt'] += 1
-        statsDict['pmfcAndCapua'] += 1
-    elif 'pmfcFicta' in note1.editorial:
-        statsDict['pmfcAlt'] += 1
-        statsDict['pmfcNotCapua'] += 1
-    elif 'capuaFicta' in note1.editorial:
-        statsDict['capuaAlt'] += 1
-        statsDict['capuaNotPmfc'] += 1
-    return statsDict
+def _countFictas(notes):
+    '''
+    Does the counting for compareSrcStreamCapuaToEditor, compareNoteCapuaToEditor,
+    and findCorrections on any iterable of notes and rests (rests are skipped),
+    keeping the counts as plain integers until the dictionary is built.
+    '''
+    totalNotes = 0
+    pmfcNotCapua = 0
+    capuaNotPmfc = 0
+    pmfcAndCapua = 0
+    for note1 in notes:
+        if note1.isRest:
+            continue
+        totalNotes += 1
+        hasPmfc = 'pmfcFicta' in note1.editorial
+        hasCapua = 'capuaFicta' in note1.editorial
+        if hasPmfc and hasCapua:
+            pmfcAndCapua += 1
+        elif hasPmfc:
+            pmfcNotCapua += 1
+        elif hasCapua:
+            capuaNotPmfc += 1
+    return {
+        'totalNotes': totalNotes,
+        'pmfcAlt': pmfcNotCapua + pmfcAndCapua,
+        'capuaAlt': capuaNotPmfc + pmfcAndCapua,
+        'pmfcNotCapua': pmfcNotCapua,
+        'capuaNotPmfc': capuaNotPmfc,
+        'pmfcAndCapua': pmfcAndCapua,
+        }
 
 
-def compareOnesrcStream(srcStream1, srcStream2, fictaType='editor'):
+def compareOnesrcStream(srcStream1, srcStream2, fictaType='editor', alreadyAttached=False):
     '''
     Helper function for evaluating Harmony that for each note in srcStream1 determines
     that notes starting interval in relation to srcStream2, and assigns identifiers to
@@ -678,39 +957,50 @@ def compareOnesrcStream(srcStream1, srcStream2, fictaType='editor'):
     noFictaHarmony if there is no ficta for that note. Returns a list of the number
     of perfect consonances, imperfect consonances, and other (dissonances) for srcStream1.
     For the fictaType variable, write 'editor' or 'capua', 'capua1srcStream' or 'capua2srcStream'.
+
+    Set alreadyAttached to True if the intervals between the two srcStreams have
+    been attached (in both directions) since any of their pitches last changed.
     '''
     perfectConsCount = 0
     imperfConsCount = 0
     othersCount = 0
 
+    # looked up once, rather than by printDebug for every note with ficta
+    debug = environLocal['debug']
+
     # populates the note.editorial.harmonicInterval object
-    srcStream1.attachIntervalsBetweenStreams(srcStream2)
-    srcStream2.attachIntervalsBetweenStreams(srcStream1)
+    if not alreadyAttached:
+        srcStream1.attachIntervalsBetweenStreams(srcStream2)
+        srcStream2.attachIntervalsBetweenStreams(srcStream1)
     for note1 in srcStream1.notes:
+        editorial = note1.editorial
         hasFicta = False
-        interval1 = note1.editorial.harmonicInterval
+        interval1 = editorial.harmonicInterval
         if interval1 is None:
             continue   # must have a rest in the other voice
         # name1 = interval1.diatonic.name
         # read ficta as actual accidental
-        if note1.editorial.ficta is not None:
+        if editorial.ficta is not None:
             hasFicta = True
 
         iType = getIntervalType(interval1)
         if hasFicta and fictaType == 'editor':
-            environLocal.printDebug('found ficta of Editor type')
-            note1.editorial.editorFictaHarmony = iType
-            note1.editorial.editorFictaInterval = interval1
+            if debug:
+                environLocal.printDebug('found ficta of Editor type')
+            editorial.editorFictaHarmony = iType
+            editorial.editorFictaInterval = interval1
         elif hasFicta and fictaType == 'capua1srcStream':
-            environLocal.printDebug('found ficta of capua1srcStream type')
-            note1.editorial.capua1FictaHarmony = iType
-            note1.editorial.capua1FictaInterval = interval1
+            if debug:
+                environLocal.printDebug('found ficta of capua1srcStream type')
+            editorial.capua1FictaHarmony = iType
+            editorial.capua1FictaInterval = interval1
         elif hasFicta and fictaType == 'capua2srcStream':
-            environLocal.printDebug('found ficta of capua2srcStream type')
-            note1.editorial.capua2FictaHarmony = iType
-            note1.editorial.capua2FictaInterval = interval1
+            if debug:
+                environLocal.printDebug('found ficta of capua2srcStream type')
+            editorial.capua2FictaHarmony = iType
+            editorial.capua2FictaInterval = interval1
         else:
-            note1.editorial.noFictaHarmony = iType
+            editorial.noFictaHarmony = iType
 
         if iType == 'perfect cons':
             perfectConsCount += 1
@@ -730,17 +1020,13 @@ def getIntervalType(interval1):
         return None
     elif interval1.diatonic is None:
         return None
-    elif interval1.diatonic.name in PerfectCons:
-        return 'perfect cons'
-    elif interval1.diatonic.name in ImperfCons:
-        return 'imperfect cons'
-    elif interval1.diatonic.name in Others:
-        return 'dissonance'
-    else:
+    try:
+        return _INTERVAL_TYPES[interval1.diatonic.name]
+    except KeyError:
         raise CapuaException(
             'Wow!  The first ' + interval1.niceName
             + ' I have ever seen in 14th century music!  Go publish!  (or check for errors...)'
-        )
+        ) from None
 
 
 betterColor = 'green'
@@ -755,8 +1041,8 @@ def colorCapuaFicta(srcStream1, srcStream2, oneOrBoth='both'):
     using betterColor, worseColor, and neutralColor.
 
     '''
-    srcStream1.attachIntervalsBetweenStreams(srcStream2)
-    srcStream2.attachIntervalsBetweenStreams(srcStream1)
+    # no intervals are attached here: every comparison below attaches its own,
+    # after the ficta that it compares have been put into the pitches.
     capuaCount = evaluateRules(srcStream1, srcStream2)
     environLocal.printDebug('Capua count: %r' % capuaCount)
     noFictaCount = evaluateWithoutFicta(srcStream1, srcStream2)
@@ -798,6 +1084,61 @@ def ruleOne(note1, nonCapuaHarmony, capuaHarmony):
         note1.editorial.fictaColor = worseColor
 
 
+@functools.lru_cache(maxsize=1)
+def _getBallataSheet():
+    '''
+    Returns the BallataSheet used by the analyses and tests below, opening
+    the workbook only once.  It is shared, so callers only read from it
+    (each call to makeWork builds a new work).
+
+    >>> _getBallataSheet() is _getBallataSheet()
+    True
+    '''
+    return cadencebook.BallataSheet()
+
+
+def _analyzedSnippets(startPiece, endPiece, warn=False, bothVoices=True):
+    '''
+    Does the preparation shared by findCorrections and improvedHarmony, one
+    snippet at a time.  For each snippet with at least two parts (other than an
+    incipit) in the ballate from startPiece up to endPiece, yields
+    (pieceObj, thisSnippet, srcStream1, srcStream2), where srcStream1 and
+    srcStream2 are the flat notes and rests of the cantus and the tenor (a
+    third voice is ignored for now), with the intervals between them attached
+    in both directions and the Capua rules applied to both.  If bothVoices is
+    False, only the intervals from the cantus to the tenor are attached and
+    the rules are only applied to the cantus.
+
+    If warn is True, a warning names each piece as it is started.
+    '''
+    ballataObj = _getBallataSheet()
+    for j in range(startPiece, endPiece):  # all ballate
+        pieceObj = ballataObj.makeWork(j)  # N.B. -- we now use Excel column numbers
+        if pieceObj.incipit is None:
+            continue
+        if warn:
+            environLocal.warn('Working on piece number %d, %s ' % (j, pieceObj.title))
+        for thisSnippet in pieceObj.snippets:
+            if thisSnippet is None:
+                continue
+            if isinstance(thisSnippet, polyphonicSnippet.Incipit):
+                continue
+            # one pass over the parts, rather than one to count them and
+            # one more to find each voice by id
+            partsById = {p.id: p for p in thisSnippet.parts}
+            if len(partsById) < 2:
+                continue
+            srcStream1 = partsById['C'].flat.notesAndRests
+            srcStream2 = partsById['T'].flat.notesAndRests
+            srcStream1.attachIntervalsBetweenStreams(srcStream2)
+            if bothVoices:
+                srcStream2.attachIntervalsBetweenStreams(srcStream1)
+            applyCapuaToStream(srcStream1)
+            if bothVoices:
+                applyCapuaToStream(srcStream2)
+            yield pieceObj, thisSnippet, srcStream1, srcStream2
+
+
 def findCorrections(correctionType='Maj3', startPiece=2, endPiece=459):
     '''
     Find all cases where a Major 3rd moves inward to unison (within the next two or
@@ -830,101 +1171,120 @@ def findCorrections(correctionType='Maj3', startPiece=2, endPiece=459):
 #    >>> #_DOCS_SHOW foundPieceOpus.show('lily.pdf')
 
     '''
-    ballataObj = cadencebook.BallataSheet()
-    totalDict = {
-        'totalNotes': 0,
-        'pmfcAlt': 0,
-        'capuaAlt': 0,
-        'pmfcNotCapua': 0,
-        'capuaNotPmfc': 0,
-        'pmfcAndCapua': 0,
-        'potentialChange': 0
-        }
+    # the counts of _countFictas over all the candidates
+    totalDict = _countFictas([])
 
+    # which resolution to look for is decided here once, rather than for every
+    # note that follows a candidate: a unison is found by its simple name, an
+    # octave by its semi-simple name.
     if correctionType == 'Maj3':
         notesToCheck = 1
         simpleNameToCheck = 'm3'
+        resolutionName = 'P1'
+        resolvesBySemiSimpleName = False
     elif correctionType == 'min6':
         notesToCheck = 2  # allows Landini cadences, but not much more
         simpleNameToCheck = 'M6'
+        resolutionName = 'P8'
+        resolvesBySemiSimpleName = True
     else:
         raise CapuaException('Invalid correctionType to check; I can check "Maj3" or "min6"')
 
     foundPieceOpus = stream.Opus()
 
-    for j in range(startPiece, endPiece):  # all ballate
-        pieceObj = ballataObj.makeWork(j)  # N.B. -- we now use Excel column numbers
-        if pieceObj.incipit is None:
+    for unused_pieceObj, thisSnippet, srcStream1, srcStream2 in _analyzedSnippets(
+            startPiece, endPiece, warn=True):
+        foundPieceOpus.insert(0, thisSnippet)
+
+        for ss in [srcStream1, srcStream2]:
+            srcStreamNotes = list(ss.notes)  # get rid of rests
+            # only the notes found by _correctionCandidates are looked at again
+            harmonicIntervals = [n.editorial.harmonicInterval for n in srcStreamNotes]
+            simpleNames = [hI.simpleName if hI is not None else None
+                           for hI in harmonicIntervals]
+            if resolvesBySemiSimpleName:
+                resolutionNames = [hI.semiSimpleName if hI is not None else None
+                                   for hI in harmonicIntervals]
+            else:
+                resolutionNames = simpleNames
+            candidates = _correctionCandidates(simpleNames, simpleNameToCheck,
+                                               resolutionNames, resolutionName, notesToCheck)
+            voiceDict = _countFictas(srcStreamNotes[i] for i in candidates)
+            for thisKey, thisCount in voiceDict.items():
+                totalDict[thisKey] += thisCount
+
+    # every candidate is a note (not a rest), so it is also a potential change
+    totalDict['potentialChange'] = totalDict['totalNotes']
+    return totalDict, foundPieceOpus
+
+
+# what _harmonicIntervalFields gives for a note without a harmonic interval
+_NO_INTERVAL_FIELDS = (None, None, None)
+
+
+def _harmonicIntervalFields(notes):
+    '''
+    Returns, for each note, the parts of `note.editorial.harmonicInterval` that
+    improvedHarmony looks at, as a tuple of (generic.perfectable,
+    generic.simpleUndirected, diatonic.specificName), or all None if the note
+    has no harmonic interval.  Each property is read once, rather than every
+    time that it is tested.
+    '''
+    fields = []
+    for n in notes:
+        hI = n.editorial.harmonicInterval
+        if hI is None:
+            fields.append(_NO_INTERVAL_FIELDS)
             continue
-        environLocal.warn('Working on piece number %d, %s ' % (j, pieceObj.title))
-        for thisSnippet in pieceObj.snippets:
-            thisSnippetAppended = False
-            if thisSnippet is None:
-                continue
-            if 'Incipit' in thisSnippet.classes:
-                continue
-            thisSnippetParts = thisSnippet.parts
-            if len(thisSnippetParts) < 2:
-                continue
-            srcStream1 = thisSnippetParts['C'].flat.notesAndRests
-            srcStream2 = thisSnippetParts['T'].flat.notesAndRests
-            # ignore 3rd voice for now...
-            srcStream1.attachIntervalsBetweenStreams(srcStream2)
-            srcStream2.attachIntervalsBetweenStreams(srcStream1)
+        generic = hI.generic
+        fields.append((generic.perfectable, generic.simpleUndirected,
+                       hI.diatonic.specificName))
+    return fields
 
-            if thisSnippetAppended is False:
-                foundPieceOpus.insert(0, thisSnippet)
-                thisSnippetAppended = True
-            applyCapuaToStream(srcStream1)
-            applyCapuaToStream(srcStream2)
-
-            for ss in [srcStream1, srcStream2]:
-                srcStreamNotes = ss.notes  # get rid of rests
-                srcStreamLen = len(srcStreamNotes)
-                for (i, note1) in enumerate(srcStreamNotes):
-                    if (note1.editorial.harmonicInterval is None
-                            or note1.editorial.harmonicInterval.simpleName != simpleNameToCheck):
-                        continue
-                    if i >= srcStreamLen - notesToCheck:
-                        if i == srcStreamLen - 1:
-                            continue
-                        else:
-                            nextFewNotes = srcStreamNotes[i + 1:]
-                    else:
-                        nextFewNotes = srcStreamNotes[(i + 1):(i + 1 + notesToCheck)]
-                    # nextFewNotes = srcStream1.notesFollowingNote(note1,
-                    #                       notesToCheck, allowRests = False)
-                    foundP8 = False
-                    for thisNote in nextFewNotes:
-                        if thisNote is None:
-                            raise CapuaException(
-                                'This was only supposed to return non-None, what is up???')
-                        if thisNote.editorial.harmonicInterval is None:
-                            continue  # probably a rest; should not happen
-                        if (correctionType == 'Maj3'
-                                and thisNote.editorial.harmonicInterval.simpleName == 'P1'):
-                            foundP8 = True
-                        elif (correctionType == 'min6'
-                                and thisNote.editorial.harmonicInterval.semiSimpleName == 'P8'):
-                            foundP8 = True
-                    if foundP8 is False:
-                        continue
-                    newResults = compareNoteCapuaToEditor(note1)
-                    newResults['potentialChange'] = 1
-                    for thisKey in newResults:
-                        if thisKey == 'alterAll':
-                            continue
-                        if (thisKey == 'capuaNotPmfc'
-                                and newResults[thisKey] == 1
-                                and thisSnippetAppended is False):
-                            foundPieceOpus.insert(0, thisSnippet)
-                            thisSnippetAppended = True
-                        totalDict[thisKey] += newResults[thisKey]
 
-    return totalDict, foundPieceOpus
+def _correctionCandidates(simpleNames, simpleNameToCheck,
+                          resolutionNames, resolutionName, notesToCheck):
+    '''
+    Returns the indices of the notes whose harmonic interval is simpleNameToCheck
+    and is followed, within the next notesToCheck notes, by resolutionName.
+    Works only on the list of the simple names of the notes' harmonic intervals
+    and the list of names in which to look for the resolution (None for a note
+    without a harmonic interval).
+
+    >>> names = ['m3', 'P1', 'm3', None, 'P1']
+    >>> _correctionCandidates(names, 'm3', names, 'P1', 1)
+    [0]
+    >>> _correctionCandidates(names, 'm3', names, 'P1', 2)
+    [0, 2]
+    '''
+    candidates = []
+    numNotes = len(simpleNames)
+    # the last note has no notes after it, so it is never a candidate
+    for i in _patternStarts(simpleNames, simpleNameToCheck, numNotes - 1):
+        if resolutionName in resolutionNames[i + 1:i + 1 + notesToCheck]:
+            candidates.append(i)
+    return candidates
 
 
-def improvedHarmony(startPiece=2, endPiece=459):
+def _mapPieces(pieceFunction, pieceNumbers, maxWorkers=1):
+    '''
+    Returns the list of pieceFunction(pieceNumber) for each of pieceNumbers.
+    The pieces are independent, so if maxWorkers is not 1 they are run in up
+    to maxWorkers processes (None for one per CPU).  Works do not pickle
+    well, so only the piece numbers are sent and each worker builds its own
+    works; pieceFunction must be a module-level function.
+    With maxWorkers=1 (the default) everything runs in this process.
+
+    >>> _mapPieces(abs, [-2, -1, 3])
+    [2, 1, 3]
+    '''
+    if maxWorkers == 1:
+        return [pieceFunction(pieceNumber) for pieceNumber in pieceNumbers]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        return list(executor.map(pieceFunction, pieceNumbers, chunksize=16))
+
+
+def improvedHarmony(startPiece=2, endPiece=459, maxWorkers=1):
     '''
     Find how often an augmented or diminished interval was corrected to a perfect
     interval and vice-versa
@@ -932,15 +1292,32 @@ def improvedHarmony(startPiece=2, endPiece=459):
 
     Returns a dict showing the results
 
+    maxWorkers is as for _mapPieces.
+
 
     >>> #_DOCS_SHOW improvedHarmony()
     >>> print("{'imperfCapua': 22, 'imperfIgnored': 155, " + #_DOCS_HIDE
     ...    "'perfCapua': 194, 'perfIgnored': 4057}") #_DOCS_HIDE
     {'imperfCapua': 22, 'imperfIgnored': 155, 'perfCapua': 194, 'perfIgnored': 4057}
     '''
+    checkDict = {
+                 'perfIgnored': 0,
+                 'perfCapua': 0,
+                 'imperfIgnored': 0,
+                 'imperfCapua': 0
+                 }
+    for pieceDict in _mapPieces(_improvedHarmonyOfPiece,
+                                range(startPiece, endPiece),
+                                maxWorkers):
+        for thisKey, thisCount in pieceDict.items():
+            checkDict[thisKey] += thisCount
+    return checkDict
 
-    ballataObj = cadencebook.BallataSheet()
 
+def _improvedHarmonyOfPiece(pieceNumber):
+    '''
+    The counts of improvedHarmony for one ballata.
+    '''
     checkDict = {
                  'perfIgnored': 0,
                  'perfCapua': 0,
@@ -948,55 +1325,40 @@ def improvedHarmony(startPiece=2, endPiece=459):
                  'imperfCapua': 0
                  }
 
-    for j in range(startPiece, endPiece):  # all ballate
-        # environLocal.printDebug('Working on piece number %d ' % j)
-        pieceObj = ballataObj.makeWork(j)  # N.B. -- we now use Excel column numbers
-        if pieceObj.incipit is None:
-            continue
-        for thisSnippet in pieceObj.snippets:
-            # thisSnippetAppended = False
-            if thisSnippet is None:
+    for unused_pieceObj, unused_snippet, srcStream1, unused_srcStream2 in _analyzedSnippets(
+            pieceNumber, pieceNumber + 1, bothVoices=False):
+        # only the cantus is counted, so the tenor is left alone
+        srcStreamNotes = list(srcStream1.notes)  # get rid of rests
+        # read everything from the notes up front, so that the loop below only
+        # works on plain values
+        hasCapuaFicta = ['capuaFicta' in n.editorial for n in srcStreamNotes]
+
+        for fields, capuaChanged in zip(_harmonicIntervalFields(srcStreamNotes),
+                                        hasCapuaFicta):
+            perfectable, simpleUndirected, specificName = fields
+            if (fields is _NO_INTERVAL_FIELDS or
+                    perfectable is False or
+                    simpleUndirected == 4):
                 continue
-            if 'Incipit' in thisSnippet.classes:
-                continue
-            thisSnippetParts = thisSnippet.parts
-            if len(thisSnippetParts) < 2:
-                continue
-            srcStream1 = thisSnippetParts['C'].flat.notesAndRests
-            srcStream2 = thisSnippetParts['T'].flat.notesAndRests  # ignore 3rd voice for now...
-            srcStream1.attachIntervalsBetweenStreams(srcStream2)
-            # srcStream2.attachIntervalsBetweenStreams(srcStream1)
-            applyCapuaToStream(srcStream1)
 
-            for ss in [srcStream1, srcStream2]:
-                srcStreamNotes = ss.notes  # get rid of rests
-                # srcStreamLen = len(srcStreamNotes)
-
-                for (i, note1) in enumerate(srcStreamNotes):
-                    hI = note1.editorial.harmonicInterval
-                    if (hI is None or
-                            hI.generic.perfectable is False or
-                            hI.generic.simpleUndirected == 4):
-                        continue
-
-                    # KEEP PROGRAMMING FROM HERE
-                    if hI.diatonic.specificName == 'Perfect':
-                        if 'capuaFicta' in note1.editorial:
-                            checkDict['perfCapua'] += 1  # ugh, Capua changed a P1, P5, or P8
-                        else:
-                            checkDict['perfIgnored'] += 1  # yay, Capua left it alone
-                    else:
-                        if 'capuaFicta' in note1.editorial:
-                            checkDict['imperfCapua'] += 1
-                            # yay Capua changed a A1 or d1, A5 or d5, or A8 or d8
-                        else:
-                            checkDict['imperfIgnored'] += 1  # hrumph, Capua left it alone
+            # KEEP PROGRAMMING FROM HERE
+            if specificName == 'Perfect':
+                if capuaChanged:
+                    checkDict['perfCapua'] += 1  # ugh, Capua changed a P1, P5, or P8
+                else:
+                    checkDict['perfIgnored'] += 1  # yay, Capua left it alone
+            else:
+                if capuaChanged:
+                    checkDict['imperfCapua'] += 1
+                    # yay Capua changed a A1 or d1, A5 or d5, or A8 or d8
+                else:
+                    checkDict['imperfIgnored'] += 1  # hrumph, Capua left it alone
 
     return checkDict
 
 
 def runPiece(pieceNum=331, snipNum=0):  # random default piece...
-    ballataObj = cadencebook.BallataSheet()
+    ballataObj = _getBallataSheet()
     pieceObj = ballataObj.makeWork(pieceNum)
     # pieceObj.snippets[0].lily.showPNG()
     applyCapuaToScore(pieceObj)
@@ -1014,25 +1376,41 @@ def runPiece(pieceNum=331, snipNum=0):  # random default piece...
                 environLocal.printDebug(n.editorial.capuaFicta)
 
 
-def ruleFrequency(startNumber=2, endNumber=459):
-    ballataObj = cadencebook.BallataSheet()
+def ruleFrequency(startNumber=2, endNumber=459, maxWorkers=1):
+    '''
+    Returns how many times each of capua rules 1, 2, 3, 4A, and 4B fires in
+    the ballate from startNumber up to (not including) endNumber.
+    maxWorkers is as for _mapPieces.
+    '''
+    results = _mapPieces(_ruleFrequencyOfPiece, range(startNumber, endNumber), maxWorkers)
+    totals = [sum(column) for column in zip(*results)]
+    if not totals:
+        return 0, 0, 0, 0, 0
+    return tuple(totals)
+
+
+def _ruleFrequencyOfPiece(pieceNumber):
+    '''
+    The (rule 1, rule 2, rule 3, rule 4A, rule 4B) counts of one ballata
+    for ruleFrequency.
+    '''
     num1 = 0
     num2 = 0
     num3 = 0
     num4a = 0
     num4b = 0
-    for i in range(startNumber, endNumber):  # all ballate
-        pieceObj = ballataObj.makeWork(i)  # N.B. -- we now use Excel column numbers
-        for thisPolyphonicSnippet in pieceObj.snippets:
-            if thisPolyphonicSnippet is None:
-                continue
-            for thisPart in thisPolyphonicSnippet.parts:
-                thisStream = thisPart.flat.notes
-                num1 += capuaRuleOne(thisStream)
-                num2 += capuaRuleTwo(thisStream)
-                num3 += capuaRuleThree(thisStream)
-                num4a += capuaRuleFourA(thisStream)
-                num4b += capuaRuleFourB(thisStream)
+    # N.B. -- we now use Excel column numbers
+    pieceObj = _getBallataSheet().makeWork(pieceNumber)
+    for thisPolyphonicSnippet in pieceObj.snippets:
+        if thisPolyphonicSnippet is None:
+            continue
+        for thisPart in thisPolyphonicSnippet.parts:
+            thisStream = thisPart.flat.notes
+            num1 += capuaRuleOne(thisStream)
+            num2 += capuaRuleTwo(thisStream)
+            num3 += capuaRuleThree(thisStream)
+            num4a += capuaRuleFourA(thisStream)
+            num4b += capuaRuleFourB(thisStream)
 
     return num1, num2, num3, num4a, num4b
 
@@ -1042,9 +1420,23 @@ class Test(unittest.TestCase):
     def runTest(self):
         pass
 
+    def testApplyCapuaClearsEveryNote(self):
+        # notes without any ficta still get a pmfcFicta and a savedFicta, and
+        # lose their written accidentals, before the rules run
+        s = stream.Stream()
+        for name in ('G4', 'F#4', 'G4', 'B-4'):
+            s.append(note.Note(name))
+        applyCapuaToStream(s)
+        for n in s.notes:
+            self.assertIn('pmfcFicta', n.editorial)
+            self.assertIsNone(n.editorial.pmfcFicta)
+            self.assertIn('savedFicta', n.editorial)
+        self.assertEqual(s.notes[1].editorial.savedAccidental.name, 'sharp')
+        self.assertEqual(s.notes[3].editorial.savedAccidental.name, 'flat')
+
     def testRunNonCrederDonna(self):
         pieceNum = 331  # Francesco, PMFC 4 6-7: Non creder, donna
-        ballataObj = cadencebook.BallataSheet()
+        ballataObj = _getBallataSheet()
         pieceObj = ballataObj.makeWork(pieceNum)
 
         applyCapuaToCadencebookWork(pieceObj)
@@ -1082,7 +1474,7 @@ class Test(unittest.TestCase):
         return pieceObj
 
     def testRun1(self):
-        ballataSht = cadencebook.BallataSheet()
+        ballataSht = _getBallataSheet()
         pieceObj = ballataSht.makeWork(20)  # N.B. -- we now use Excel column numbers
         if pieceObj.incipit is None:
             return None
@@ -1142,7 +1534,7 @@ class TestExternal(unittest.TestCase):  # pragma: no cover
         pObj.asOpus().show('lily.png')
 
     def testShowFourA(self):
-        ballataObj = cadencebook.BallataSheet()
+        ballataObj = _getBallataSheet()
         showStream = stream.Opus()
         for i in range(2, 45):  # 459): # all ballate
             pieceObj = ballataObj.makeWork(i)  # N.B. -- we now use Excel column numbers
@@ -1167,15 +1559,8 @@ class TestSlow(unittest.TestCase):
         pass
 
     def testCompare1(self):
-        ballataObj = cadencebook.BallataSheet()
-        totalDict = {
-            'totalNotes': 0,
-            'pmfcAlt': 0,
-            'capuaAlt': 0,
-            'pmfcNotCapua': 0,
-            'capuaNotPmfc': 0,
-            'pmfcAndCapua': 0,
-            }
+        ballataObj = _getBallataSheet()
+        totalDict = collections.Counter()
 
         for i in range(232, 349):  # 232-349 is most of Landini PMFC
             pieceObj = ballataObj.makeWork(i)  # N.B. -- we now use Excel column numbers
@@ -1193,9 +1578,7 @@ class TestSlow(unittest.TestCase):
                 # srcStream2.attachIntervalsBetweenStreams(srcStream1)
 
                 applyCapuaToStream(srcStream1)
-                thisDict = compareSrcStreamCapuaToEditor(srcStream1)
-                for thisKey in thisDict:
-                    totalDict[thisKey] += thisDict[thisKey]
+                totalDict.update(compareSrcStreamCapuaToEditor(srcStream1))
 
         self.assertEqual(totalDict['capuaAlt'], 18)
         self.assertEqual(totalDict['totalNotes'], 200)
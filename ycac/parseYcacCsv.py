@@ -4,7 +4,7 @@ parseYcacCsv.py -- parse YCAC files
 import csv
 from ast import literal_eval
 from dataclasses import dataclass
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Optional
 
 from music21.chord import Chord
 from music21.note import Rest
@@ -12,7 +12,23 @@ from music21 import stream
 from music21.common.numberTools import opFrac
 
 
-@dataclass
+def parse_int_list(s: str) -> List[int]:
+    '''
+    Parses a list of integers such as '[0, 4, 7]', which is how YCAC stores
+    its lists, much faster than literal_eval; anything else goes to literal_eval.
+    '''
+    if s.startswith('[') and s.endswith(']'):
+        inner = s[1:-1]
+        if not inner.strip():
+            return []
+        try:
+            return [int(x) for x in inner.split(',')]
+        except ValueError:
+            pass
+    return literal_eval(s)
+
+
+@dataclass(slots=True)
 class YcacSalamiSlice:
     offset: float
     chord: Optional[Chord]
@@ -50,17 +66,25 @@ class YcacScoreFile:
     def __init__(self, name, composer, rows):
         self.name = name.replace('.mid', '')
         self.composer = composer
-        self.rows_dicts: List[Dict] = rows
+        self.rows_dicts: Optional[List[Dict]] = rows
         self.slices: List[YcacSalamiSlice] = []
         self.stream: Optional[stream.Part] = None
 
     def __repr__(self):
         return f'<parseYcacCsv.YcacScoreFile {self.name!r} - {self.composer}>'
 
-    def parse_rows(self):
-        self.slices = []
-        for rd in self.rows_dicts:
-            self.slices.append(self.parse_one_row_dict(rd))
+    def parse_rows(self, release_rows=False):
+        '''
+        Parses rows_dicts into slices.  If release_rows is True, rows_dicts
+        is set to None afterwards, since the slices hold everything needed
+        from them; parsing again after that raises a ValueError.
+        '''
+        if self.rows_dicts is None:
+            raise ValueError(f'The rows of {self.name!r} have already been released')
+        parse_one_row_dict = self.parse_one_row_dict
+        self.slices = [parse_one_row_dict(rd) for rd in self.rows_dicts]
+        if release_rows:
+            self.rows_dicts = None
 
     def parse_one_row_dict(self, r: Dict):
         chord_str = r['Chord'][21:-1]
@@ -72,9 +96,9 @@ class YcacScoreFile:
         ss = YcacSalamiSlice(
             offset=opFrac(float(r['offset'])),
             chord=chord_or_rest,
-            normal_form=literal_eval(r['NormalForm']),
-            pcs_normal_form=literal_eval(r['PCsInNormalForm']),
-            global_scale_degrees=literal_eval(r['GlobalScaleDegrees']),
+            normal_form=parse_int_list(r['NormalForm']),
+            pcs_normal_form=parse_int_list(r['PCsInNormalForm']),
+            global_scale_degrees=parse_int_list(r['GlobalScaleDegrees']),
             highest_pitch=int(r['HighestPitch']),
             lowest_pitch=int(r['LowestPitch'])
         )
@@ -82,15 +106,34 @@ class YcacScoreFile:
         return ss
 
     def rows_to_stream(self):
+        '''
+        Builds a Part with each slice's chord at the slice's offset, lasting
+        until the next slice starts (the last one keeps its own duration).
+
+        >>> def row(offset, pitches):
+        ...     return {'offset': offset, 'Chord': f'<music21.chord.Chord {pitches}>',
+        ...             'NormalForm': '[0, 4, 7]', 'PCsInNormalForm': '[0, 4, 7]',
+        ...             'GlobalScaleDegrees': '[1, 3, 5]',
+        ...             'HighestPitch': '67', 'LowestPitch': '60'}
+        >>> sf = YcacScoreFile('test.mid', 'Anon', [row('0.5', 'C4 E4 G4'),
+        ...                                          row('2.0', 'D4 F4 A4'),
+        ...                                          row('2.5', 'C4 E4 G4')])
+        >>> sf.parse_rows()
+        >>> p = sf.rows_to_stream()
+        >>> all(p.elementOffset(ss.chord) == ss.offset for ss in sf.slices)
+        True
+        >>> [ss.chord.quarterLength for ss in sf.slices[:-1]]
+        [1.5, 0.5]
+        '''
         s = stream.Part()
-        last_chord = Rest()
-        last_offset = 0.0
-        for ss in self.slices:
-            new_offset = ss.offset
-            last_chord.duration.quarterLength = new_offset - last_offset
-            s.coreAppend(ss.chord)
-            last_chord = ss.chord
-            last_offset = new_offset
+        chords = [ss.chord for ss in self.slices]
+        offsets = [ss.offset for ss in self.slices]
+        # each chord lasts until the next slice starts; the last one keeps
+        # its own duration.  The stream is only updated once at the end.
+        for this_chord, this_offset, next_offset in zip(chords, offsets, offsets[1:]):
+            this_chord.duration.quarterLength = next_offset - this_offset
+        for this_chord, this_offset in zip(chords, offsets):
+            s.coreInsert(this_offset, this_chord)
         s.coreElementsChanged()
         self.stream = s
         return s
@@ -99,26 +142,35 @@ class YcacScoreFile:
 class YcacCsvFile:
     def __init__(self, fn: str):
         self.filename = fn
-        self.rows: List[Dict] = []
         self.scoreFiles: List[YcacScoreFile] = []
 
     def parse(self):
-        with open(self.filename) as csvFile:
-            reader = csv.DictReader(csvFile)
-            self.rows = list(reader)
-        self.split()
+        '''
+        Reads the CSV file and splits it into score files.
+        '''
+        return self.split()
+
+    def split(self, rows: Optional[Iterable[Dict]] = None):
+        '''
+        Groups consecutive rows with the same file name into YcacScoreFiles,
+        parsing each one as soon as its last row has been seen and then
+        releasing its rows, so only the rows of one score file are held at a
+        time.  If rows is not given, they are streamed from the CSV file.
+        '''
+        if rows is None:
+            with open(self.filename, newline='') as csvFile:
+                return self.split(csv.DictReader(csvFile))
 
-    def split(self):
         currentRows = []
         currentName = ''
         currentComposer = ''
 
         scoreFiles = []
-        for r in self.rows:
+        for r in rows:
             if r['file'] != currentName:
                 if currentRows:
                     currentScoreFile = YcacScoreFile(currentName, currentComposer, currentRows)
-                    currentScoreFile.parse_rows()
+                    currentScoreFile.parse_rows(release_rows=True)
                     scoreFiles.append(currentScoreFile)
                 currentName = r['file']
                 currentComposer = r['Composer']
@@ -127,7 +179,7 @@ class YcacCsvFile:
 
         if currentRows:
             currentScoreFile = YcacScoreFile(currentName, currentComposer, currentRows)
-            currentScoreFile.parse_rows()
+            currentScoreFile.parse_rows(release_rows=True)
             scoreFiles.append(currentScoreFile)
 
         self.scoreFiles = scoreFiles
@@ -138,5 +190,4 @@ if __name__ == '__main__':
     in_fn = '/Users/cuthbert/Downloads/YCAC-data-1/ISlices.csv'
     ycsv = YcacCsvFile(in_fn)
     ycsv.parse()
-    ycsv.split()
 